@@ -1,18 +1,31 @@
 #!/usr/bin/env python3
-import io, os, sys, time, glob, fnmatch, json, hashlib, logging, threading
+import io, os, re, sys, mmap, time, fnmatch, json, hashlib, logging, threading, itertools
+from functools import lru_cache
 from datetime import datetime, timedelta
 from urllib.parse import quote
-from dataclasses import dataclass
-from typing import List, Optional, Dict, Tuple
+from dataclasses import dataclass, field
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Tuple, Union
 
 import yaml
+import numpy as np
 from flask import Flask, send_file, jsonify, request, abort
+import PIL
 from PIL import Image, ImageDraw, ImageFont, UnidentifiedImageError
+# Pillow-SIMD tags its builds with a ".postN" suffix (e.g. 10.4.0.post0).
+PIL_SIMD = "post" in PIL.__version__
 try:
     import pillow_heif
     pillow_heif.register_heif_opener()
+    # HEIC from phones is a grid of HEVC tiles; let libheif decode them in parallel
+    pillow_heif.options.DECODE_THREADS = os.cpu_count() or 4
+    # We only ever decode the primary image: don't enumerate thumbnail or
+    # depth-map handles on open (pillow-heif can't decode thumbnails anyway).
+    pillow_heif.options.THUMBNAILS = False
+    pillow_heif.options.DEPTH_IMAGES = False
 except Exception:
-    pass
+    pillow_heif = None
 
 import pychromecast
 from dateutil import parser as dateparser
@@ -21,12 +34,31 @@ import exifread
 # Optional deps
 try:
     import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config as BotoConfig
 except Exception:
     boto3 = None
 try:
     from webdav3.client import Client as WebDAVClient
 except Exception:
     WebDAVClient = None
+try:
+    import blake3
+except Exception:
+    blake3 = None
+try:
+    from pic_scale import Plan as ScalePlan, Resampling as ScaleResampling
+except Exception:
+    ScalePlan = None
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB, TJSAMP_420, TJFLAG_PROGRESSIVE
+    turbo = TurboJPEG()  # raises if libturbojpeg itself is missing
+except Exception:
+    turbo = None
+try:
+    import mozjpeg_lossless_optimization
+except Exception:
+    mozjpeg_lossless_optimization = None
 
 app = Flask(__name__)
 
@@ -42,6 +74,10 @@ logging.basicConfig(
     ]
 )
 log = logging.getLogger("photocastd")
+if PIL_SIMD:
+    log.info("Pillow-SIMD active (%s)", PIL.__version__)
+else:
+    log.warning("Stock Pillow in use; install pillow-simd for faster resizes (see service.sh)")
 
 CACHE_DIR = "/tmp/photocastd-cache"
 os.makedirs(CACHE_DIR, exist_ok=True)
@@ -56,8 +92,63 @@ class MediaItem:
     size: int
     filename: str
 
-PLAYLIST: List[MediaItem] = []
-PLAYHEAD = 0
+@dataclass
+class Playlist:
+    """Structure-of-arrays playlist: fixed-width fields are NumPy arrays so
+    filtering/sorting run vectorised; variable-length strings stay in lists.
+    MediaItems are only materialised on access."""
+    ids: np.ndarray      # U16
+    sources: np.ndarray  # U8
+    mtimes: np.ndarray   # f8
+    sizes: np.ndarray    # i8
+    paths: List[str]
+    filenames: List[str]
+    # ids in sorted order (+ their positions) for searchsorted lookups
+    id_order: np.ndarray = field(init=False, repr=False)
+    ids_sorted: np.ndarray = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.id_order = np.argsort(self.ids)
+        self.ids_sorted = self.ids[self.id_order]
+
+    @classmethod
+    def from_items(cls, items: List[MediaItem]) -> "Playlist":
+        return cls(ids=np.array([i.id for i in items], dtype="U16"),
+                   sources=np.array([i.source for i in items], dtype="U8"),
+                   mtimes=np.array([i.mtime for i in items], dtype="f8"),
+                   sizes=np.array([i.size for i in items], dtype="i8"),
+                   paths=[i.path for i in items],
+                   filenames=[i.filename for i in items])
+
+    def take(self, order: np.ndarray) -> "Playlist":
+        return Playlist(ids=self.ids[order], sources=self.sources[order],
+                        mtimes=self.mtimes[order], sizes=self.sizes[order],
+                        paths=[self.paths[i] for i in order],
+                        filenames=[self.filenames[i] for i in order])
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __getitem__(self, i: int) -> MediaItem:
+        return MediaItem(id=str(self.ids[i]), source=str(self.sources[i]),
+                         path=self.paths[i], mtime=float(self.mtimes[i]),
+                         size=int(self.sizes[i]), filename=self.filenames[i])
+
+    def find(self, item_id: str) -> Optional[MediaItem]:
+        pos = int(np.searchsorted(self.ids_sorted, item_id))
+        if pos < len(self.ids_sorted) and self.ids_sorted[pos] == item_id:
+            return self[int(self.id_order[pos])]
+        return None
+
+PLAYLIST = Playlist.from_items([])
+PLAYLIST_LOCK = threading.RLock()  # guards swapping PLAYLIST on reindex
+# Each caster keeps its own position and only publishes it here on advance.
+# In shared mode the devices instead draw slides from one counter, so every
+# TV shows a different photo of the same sequence.
+PLAYHEADS: Dict[str, int] = {}
+SHARED_PLAYHEAD = CFG["cast"].get("shared_playhead", False)
+SHARED_HEAD = itertools.count()
+SHARED_HEAD_LOCK = threading.Lock()
 CAST_THREADS: Dict[str, threading.Thread] = {}
 CAST_STOP_FLAGS: Dict[str, threading.Event] = {}
 
@@ -72,14 +163,46 @@ CAPTION_SHADOW = CFG.get("render", {}).get("caption", {}).get("shadow", True)
 
 BASE_URL = CFG.get("server", {}).get("base_url")
 
+# pic_scale plans precompute the LANCZOS weights for one (src, dst) size pair.
+# Libraries are dominated by a handful of camera resolutions, so keep a small
+# table and fall back to PIL once it is full.
+RESIZE_PLANS: Dict[Tuple[int, int, int, int, str], "ScalePlan"] = {}
+RESIZE_PLANS_MAX = 32
+
+# S3 originals are kept in RAM (LRU by item id) rather than written to disk,
+# only until their slide is rendered (later hits are served from <id>.jpg);
+# objects that don't fit under the cap still go to CACHE_DIR.
+ORIG_MEM: "OrderedDict[str, bytes]" = OrderedDict()
+ORIG_MEM_BYTES = 0
+ORIG_MEM_CAP = int(CFG.get("cache", {}).get("memory_mb", 32)) * 1024 * 1024
+ORIG_MEM_LOCK = threading.Lock()
+S3_TRANSFER = TransferConfig(multipart_chunksize=8 * 1024 * 1024,
+                             max_concurrency=8, use_threads=True) if boto3 else None
+
+# Rendered slides stay mmapped (LRU by item id) so repeat /image hits from the
+# Chromecasts don't reopen the file each time.
+RENDERED: "OrderedDict[str, Tuple[mmap.mmap, str, float]]" = OrderedDict()  # map, etag, mtime
+RENDERED_MAX = int(CFG.get("cache", {}).get("rendered_max", 64))
+RENDERED_LOCK = threading.Lock()
+
+# An original is either a local path or an in-memory buffer
+Source = Union[str, io.BytesIO]
+
 # -------- Helpers ----------
 def hash_id(source: str, path: str) -> str:
-    return hashlib.sha1(f"{source}:{path}".encode()).hexdigest()[:16]
+    key = f"{source}:{path}".encode()
+    if blake3:
+        return blake3.blake3(key).hexdigest(length=8)
+    return hashlib.sha1(key).hexdigest()[:16]
 
-def exif_datetime(local_path: str) -> Optional[str]:
+def exif_datetime(src: Source) -> Optional[str]:
     try:
-        with open(local_path, "rb") as f:
-            tags = exifread.process_file(f, stop_tag="EXIF DateTimeOriginal", details=False)
+        if isinstance(src, str):
+            with open(src, "rb") as f:
+                tags = exifread.process_file(f, stop_tag="EXIF DateTimeOriginal", details=False)
+        else:
+            src.seek(0)
+            tags = exifread.process_file(src, stop_tag="EXIF DateTimeOriginal", details=False)
         dt = tags.get("EXIF DateTimeOriginal") or tags.get("Image DateTime")
         if dt:
             # format "YYYY:MM:DD HH:MM:SS"
@@ -97,17 +220,66 @@ def ensure_font():
 
 FONT = ensure_font()
 
-def caption_image(img: Image.Image, text: str) -> Image.Image:
+def blend_fill(dst: np.ndarray, alpha: np.ndarray, value: float):
+    """Alpha-blend a flat colour into an RGB view, in place."""
+    a = alpha[:dst.shape[0], :dst.shape[1], None]
+    dst[:] = (dst * (1.0 - a) + value * a + 0.5).astype(np.uint8)
+
+# Glyph atlas: coverage mask, bearing (dx, dy) and advance per character.
+# Seeded with ASCII/Latin-1 at startup; anything else is rasterised on first use.
+Glyph = Tuple[np.ndarray, int, int, float]
+GLYPHS: Dict[str, Glyph] = {}
+
+def rasterize_glyph(ch: str) -> Glyph:
+    l, t, r, b = FONT.getbbox(ch)
+    mask = Image.new("L", (max(r - l, 0), max(b - t, 0)))
+    if r > l and b > t:
+        ImageDraw.Draw(mask).text((-l, -t), ch, font=FONT, fill=255)
+    return np.asarray(mask), l, t, FONT.getlength(ch)
+
+def glyph(ch: str) -> Glyph:
+    g = GLYPHS.get(ch)
+    if g is None:
+        g = GLYPHS[ch] = rasterize_glyph(ch)
+    return g
+
+if FONT:
+    for _cp in range(0x20, 0x100):
+        glyph(chr(_cp))
+
+def caption_image(arr: np.ndarray, text: str) -> np.ndarray:
+    """Draw the caption into an RGB array in place.
+    Only the bottom band is touched: cached glyph masks are composited into a
+    small coverage mask, which is blended black (shadow, offset 2px) then white."""
     if not CAPTION or not text or not FONT:
-        return img
-    draw = ImageDraw.Draw(img)
-    w, h = img.size
+        return arr
+    h, w = arr.shape[:2]
     margin = int(FONT_SIZE * 0.6)
     x, y = margin, h - FONT_SIZE - margin
+    top = max(0, y)
+    band = arr[top:]
+    bh = band.shape[0]
+    cov = np.zeros((bh, w), dtype=np.uint8)
+    l, t, r, b = w, bh, 0, 0
+    pen = float(x)
+    for ch in text:
+        mask, dx, dy, adv = glyph(ch)
+        gx, gy = int(round(pen)) + dx, y - top + dy
+        pen += adv
+        x0, y0 = max(gx, 0), max(gy, 0)
+        x1, y1 = min(gx + mask.shape[1], w), min(gy + mask.shape[0], bh)
+        if x1 <= x0 or y1 <= y0:
+            continue
+        dst = cov[y0:y1, x0:x1]
+        np.maximum(dst, mask[y0-gy:y1-gy, x0-gx:x1-gx], out=dst)
+        l, t, r, b = min(l, x0), min(t, y0), max(r, x1), max(b, y1)
+    if r <= l or b <= t:
+        return arr
+    alpha = cov[t:b, l:r].astype(np.float32) / 255.0
     if CAPTION_SHADOW:
-        draw.text((x+2, y+2), text, font=FONT, fill=(0, 0, 0))
-    draw.text((x, y), text, font=FONT, fill=(255, 255, 255))
-    return img
+        blend_fill(band[t+2:b+2, l+2:r+2], alpha, 0.0)
+    blend_fill(band[t:b, l:r], alpha, 255.0)
+    return arr
 
 def fit_long_edge(img: Image.Image, long_edge: int) -> Image.Image:
     if not long_edge or long_edge <= 0:
@@ -118,20 +290,129 @@ def fit_long_edge(img: Image.Image, long_edge: int) -> Image.Image:
         return img
     scale = long_edge / float(le)
     new_size = (int(w*scale), int(h*scale))
-    return img.resize(new_size, Image.LANCZOS)
+    if ScalePlan is None:
+        return img.resize(new_size, Image.LANCZOS)
+    key = (w, h) + new_size + (img.mode,)
+    try:
+        plan = RESIZE_PLANS.get(key)
+        if plan is None:
+            if len(RESIZE_PLANS) >= RESIZE_PLANS_MAX:
+                return img.resize(new_size, Image.LANCZOS)
+            plan = ScalePlan((w, h), new_size, ScaleResampling.LANCZOS, img.mode, workers=0)
+            RESIZE_PLANS[key] = plan
+        return plan.resize(img)
+    except Exception:
+        # e.g. a mode pic_scale doesn't support; PIL always works
+        log.debug("pic_scale resize failed, falling back to PIL", exc_info=True)
+        return img.resize(new_size, Image.LANCZOS)
 
-def load_local(path: str) -> bytes:
-    with Image.open(path) as im:
-        im = fit_long_edge(im.convert("RGB"), LONG_EDGE)
-        dt = exif_datetime(path)
-        cap = CAPTION_TEXT.format(datetime=dt or "", filename=os.path.basename(path))
-        im = caption_image(im, cap)
+JPEG_EXTS = (".jpg", ".jpeg")
+HEIC_EXTS = (".heic", ".heif")
+
+def jpeg_scaling_factor(w: int, h: int) -> Optional[Tuple[int, int]]:
+    """Smallest DCT-domain scale (1/8, 1/4, 1/2) that still covers LONG_EDGE."""
+    if not LONG_EDGE or LONG_EDGE <= 0:
+        return None
+    le = max(w, h)
+    for num, den in ((1, 8), (1, 4), (1, 2)):
+        if le * num // den >= LONG_EDGE:
+            return (num, den)
+    return None
+
+def open_rgb(src: Source, name: Optional[str] = None) -> Image.Image:
+    """Decode to RGB; JPEGs go through libjpeg-turbo when available.
+    `name` carries the original filename for cached originals (<id>.orig) and
+    in-memory buffers. Large JPEGs are decoded straight at a reduced scale
+    (1/2..1/8) so the resize only has to cover the last step down to LONG_EDGE."""
+    name = name or (src if isinstance(src, str) else "")
+    is_jpeg = name.lower().endswith(JPEG_EXTS)
+    if pillow_heif and name.lower().endswith(HEIC_EXTS):
+        try:
+            if not isinstance(src, str):
+                src.seek(0)
+            heif = pillow_heif.open_heif(src, convert_hdr_to_8bit=True)
+            return heif.to_pillow().convert("RGB")
+        except Exception:
+            log.debug("HEIF decode failed, falling back to PIL: %s", name)
+    if turbo and is_jpeg:
+        try:
+            if isinstance(src, str):
+                with open(src, "rb") as f:
+                    data = f.read()
+            else:
+                data = src.getvalue()
+            w, h, _, _ = turbo.decode_header(data)
+            arr = turbo.decode(data, pixel_format=TJPF_RGB,
+                               scaling_factor=jpeg_scaling_factor(w, h))
+            return Image.fromarray(arr, "RGB")
+        except Exception:
+            # e.g. CMYK or truncated files; let PIL have a go
+            log.debug("TurboJPEG decode failed, falling back to PIL: %s", name)
+    if not isinstance(src, str):
+        src.seek(0)
+    with Image.open(src) as im:
+        if is_jpeg and LONG_EDGE and LONG_EDGE > 0:
+            w, h = im.size
+            scale = LONG_EDGE / float(max(w, h))
+            if scale < 1:
+                # PIL's equivalent of the DCT-domain scale above
+                im.draft("RGB", (int(w*scale), int(h*scale)))
+        return im.convert("RGB")
+
+def encode_jpeg(arr: np.ndarray) -> bytes:
+    if turbo:
+        data = turbo.encode(arr, quality=JPEG_Q, pixel_format=TJPF_RGB,
+                            jpeg_subsample=TJSAMP_420, flags=TJFLAG_PROGRESSIVE)
+    else:
         buf = io.BytesIO()
-        im.save(buf, format="JPEG", quality=JPEG_Q, optimize=True)
-        return buf.getvalue()
+        Image.fromarray(arr, "RGB").save(buf, format="JPEG", quality=JPEG_Q,
+                                         optimize=True, progressive=True)
+        data = buf.getvalue()
+    if mozjpeg_lossless_optimization:
+        # lossless re-encode of the entropy coding; shrinks the cache ~10-20%
+        data = mozjpeg_lossless_optimization.optimize(data)
+    return data
 
-# For simplicity, for WebDAV/S3 we first cache the original locally then process via PIL.
-def cache_original(item: MediaItem) -> str:
+def load_local(path: str) -> bytes:
+    # single writable copy of the resized pixels; caption + encode reuse it
+    arr = np.array(fit_long_edge(open_rgb(path), LONG_EDGE))
+    dt = exif_datetime(path) if CAPTION else None
+    cap = CAPTION_TEXT.format(datetime=dt or "", filename=os.path.basename(path))
+    return encode_jpeg(caption_image(arr, cap))
+
+def orig_mem_get(item_id: str) -> Optional[bytes]:
+    with ORIG_MEM_LOCK:
+        data = ORIG_MEM.get(item_id)
+        if data is not None:
+            ORIG_MEM.move_to_end(item_id)
+        return data
+
+def orig_mem_put(item_id: str, data: bytes) -> bool:
+    """LRU-insert an original; False if it can never fit under the cap."""
+    global ORIG_MEM_BYTES
+    if len(data) > ORIG_MEM_CAP:
+        return False
+    with ORIG_MEM_LOCK:
+        old = ORIG_MEM.pop(item_id, None)
+        if old is not None:
+            ORIG_MEM_BYTES -= len(old)
+        while ORIG_MEM and ORIG_MEM_BYTES + len(data) > ORIG_MEM_CAP:
+            _, evicted = ORIG_MEM.popitem(last=False)
+            ORIG_MEM_BYTES -= len(evicted)
+        ORIG_MEM[item_id] = data
+        ORIG_MEM_BYTES += len(data)
+    return True
+
+def orig_mem_drop(item_id: str):
+    global ORIG_MEM_BYTES
+    with ORIG_MEM_LOCK:
+        data = ORIG_MEM.pop(item_id, None)
+        if data is not None:
+            ORIG_MEM_BYTES -= len(data)
+
+# WebDAV originals are cached on disk; S3 originals are kept in memory when
+# they fit (see ORIG_MEM) and spill to disk otherwise.
+def cache_original(item: MediaItem) -> Source:
     cache_orig = os.path.join(CACHE_DIR, f"{item.id}.orig")
     if os.path.exists(cache_orig):
         return cache_orig
@@ -139,25 +420,29 @@ def cache_original(item: MediaItem) -> str:
     if item.source == "local":
         return item.path
 
+    # Downloads land in a per-thread temp file and are renamed into place, so
+    # a concurrent render (prefetch, several TVs) never sees a partial .orig.
+    tmp = f"{cache_orig}.{threading.get_ident()}.tmp"
+
     if item.source == "webdav":
-        assert WebDAVClient, "webdavclient3 not installed"
-        wcfg = next(s for s in CFG["sources"] if s["type"] == "webdav")
-        client = WebDAVClient({"webdav_hostname": wcfg["url"],
-                               "webdav_login": wcfg["username"],
-                               "webdav_password": wcfg["password"]})
-        client.download_sync(remote_path=item.path, local_path=cache_orig)
+        assert WEBDAV_CLIENT, "webdavclient3 not installed"
+        WEBDAV_CLIENT.download_sync(remote_path=item.path, local_path=tmp)
+        os.replace(tmp, cache_orig)
         return cache_orig
 
     if item.source == "s3":
-        assert boto3, "boto3 not installed"
-        scfg = next(s for s in CFG["sources"] if s["type"] == "s3")
-        s3 = boto3.client("s3",
-                          endpoint_url=scfg.get("endpoint_url"),
-                          aws_access_key_id=scfg.get("access_key"),
-                          aws_secret_access_key=scfg.get("secret_key"))
-        with open(cache_orig, "wb") as f:
-            s3.download_fileobj(scfg["bucket"], item.path, f)
-        return cache_orig
+        data = orig_mem_get(item.id)
+        if data is not None:
+            return io.BytesIO(data)
+        assert S3_CLIENT, "boto3 not installed"
+        buf = io.BytesIO()
+        S3_CLIENT.download_fileobj(S3_CFG["bucket"], item.path, buf, Config=S3_TRANSFER)
+        if not orig_mem_put(item.id, buf.getvalue()):
+            with open(tmp, "wb") as f:
+                f.write(buf.getbuffer())
+            os.replace(tmp, cache_orig)
+            return cache_orig
+        return buf
 
     raise RuntimeError("Unknown source")
 
@@ -167,38 +452,131 @@ def render_cached(item: MediaItem) -> str:
         return out_jpg
     src = cache_original(item)
     try:
-        with Image.open(src) as im:
-            im = fit_long_edge(im.convert("RGB"), LONG_EDGE)
-            dt = exif_datetime(src) if os.path.exists(src) else None
-            cap = CAPTION_TEXT.format(datetime=dt or "", filename=item.filename)
-            im = caption_image(im, cap)
-            im.save(out_jpg, "JPEG", quality=JPEG_Q, optimize=True)
+        arr = np.array(fit_long_edge(open_rgb(src, item.filename), LONG_EDGE))
+        # EXIF is only needed for the caption; the .jpg cache makes this once per item
+        dt = exif_datetime(src) if CAPTION else None
+        cap = CAPTION_TEXT.format(datetime=dt or "", filename=item.filename)
+        data = encode_jpeg(caption_image(arr, cap))
+        # write-then-rename: a prefetch and an /image hit may render together
+        tmp = f"{out_jpg}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, out_jpg)
     except UnidentifiedImageError:
         log.warning("Skipping unreadable image: %s", item.path)
+        orig_mem_drop(item.id)
         raise
+    # the .jpg now answers every later request; don't hold the original
+    orig_mem_drop(item.id)
     return out_jpg
 
-def matches_any(name: str, globs: List[str]) -> bool:
-    return any(fnmatch.fnmatch(name.lower(), g.lower()) for g in globs)
+def rendered_bytes(item: MediaItem) -> Tuple[io.BytesIO, str, float]:
+    """Rendered JPEG for item plus its ETag and mtime for conditional GETs.
+    The BytesIO is a copy of the map: it saves the open(), not the copy."""
+    with RENDERED_LOCK:
+        entry = RENDERED.get(item.id)
+        if entry is not None:
+            RENDERED.move_to_end(item.id)
+            mm, etag, mtime = entry
+            return io.BytesIO(mm), etag, mtime
+    out_jpg = render_cached(item)
+    with open(out_jpg, "rb") as f:
+        st = os.fstat(f.fileno())
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    etag = f"{item.id}-{st.st_mtime_ns}-{st.st_size}"
+    with RENDERED_LOCK:
+        old = RENDERED.pop(item.id, None)
+        if old is not None:
+            old[0].close()
+        RENDERED[item.id] = (mm, etag, st.st_mtime)
+        while len(RENDERED) > RENDERED_MAX:
+            _, evicted = RENDERED.popitem(last=False)
+            evicted[0].close()
+        # copy out under the lock so eviction can't close the map mid-read
+        return io.BytesIO(mm), etag, st.st_mtime
+
+@lru_cache(maxsize=None)
+def compile_globs(globs: Tuple[str, ...]) -> "re.Pattern":
+    # One alternation instead of re-translating each glob per candidate
+    if not globs:
+        return re.compile(r"(?!)")  # like any([]): nothing matches
+    return re.compile("|".join(fnmatch.translate(g.lower()) for g in globs))
+
+def matches_any(name: str, pat: "re.Pattern") -> bool:
+    return pat.match(name.lower()) is not None
+
+LOCAL_PARALLEL_MIN = 10000  # stat big trees from a worker pool
+LOCAL_WORKERS = 8
+
+@lru_cache(maxsize=None)
+def compile_path_glob(g: str) -> Tuple[Optional["re.Pattern"], ...]:
+    """Split a local include glob into one pattern per path segment (None for
+    "**"), so matching follows glob(..., recursive=True): "*" never crosses
+    "/" and "**" spans zero or more directories."""
+    return tuple(None if seg == "**" else re.compile(fnmatch.translate(seg.lower()))
+                 for seg in g.strip("/").split("/"))
+
+def match_path(parts: Tuple[str, ...], segs: Tuple[Optional["re.Pattern"], ...]) -> bool:
+    if not segs:
+        return not parts
+    if segs[0] is None:
+        return any(match_path(parts[i:], segs[1:]) for i in range(len(parts) + 1))
+    return (bool(parts) and segs[0].match(parts[0]) is not None
+            and match_path(parts[1:], segs[1:]))
+
+def match_prefix(parts: Tuple[str, ...], segs: Tuple[Optional["re.Pattern"], ...]) -> bool:
+    """Could a file below directory `parts` still match? Used to prune the walk."""
+    if not parts:
+        return bool(segs)
+    if not segs:
+        return False
+    if segs[0] is None:
+        return True
+    return segs[0].match(parts[0]) is not None and match_prefix(parts[1:], segs[1:])
+
+def scan_tree(root: str, globs: List[Tuple[Optional["re.Pattern"], ...]],
+              rel: Tuple[str, ...] = ()):
+    """Yield DirEntry objects under root whose relative path matches one of
+    the segment-compiled globs (case-insensitively). Hidden files and
+    directories are skipped, as glob does."""
+    try:
+        it = os.scandir(root)
+    except OSError:
+        return
+    with it:
+        for entry in it:
+            if entry.name.startswith("."):
+                continue
+            sub = rel + (entry.name.lower(),)
+            if entry.is_dir():
+                if any(match_prefix(sub, g) for g in globs):
+                    yield from scan_tree(entry.path, globs, sub)
+            elif any(match_path(sub, g) for g in globs):
+                yield entry
+
+def local_item(entry: os.DirEntry) -> Optional[MediaItem]:
+    try:
+        st = entry.stat()
+    except FileNotFoundError:
+        return None  # removed between readdir and stat
+    return MediaItem(
+        id=hash_id("local", entry.path),
+        source="local",
+        path=entry.path,
+        mtime=st.st_mtime,
+        size=st.st_size,
+        filename=entry.name
+    )
 
 def add_local_source(scfg) -> List[MediaItem]:
-    items = []
     globs = scfg.get("include_globs", ["**/*.jpg","**/*.jpeg","**/*.png","**/*.heic"])
-    for g in globs:
-        for p in glob.glob(os.path.join(scfg["path"], g), recursive=True):
-            try:
-                st = os.stat(p)
-            except FileNotFoundError:
-                continue
-            items.append(MediaItem(
-                id=hash_id("local", p),
-                source="local",
-                path=p,
-                mtime=st.st_mtime,
-                size=st.st_size,
-                filename=os.path.basename(p)
-            ))
-    return items
+    entries = list(scan_tree(scfg["path"], [compile_path_glob(g) for g in globs]))
+    if len(entries) > LOCAL_PARALLEL_MIN:
+        with ThreadPoolExecutor(max_workers=LOCAL_WORKERS) as ex:
+            found = list(ex.map(local_item, entries))
+    else:
+        found = [local_item(e) for e in entries]
+    return [i for i in found if i]
 
 def add_webdav_source(scfg) -> List[MediaItem]:
     if not WebDAVClient:
@@ -206,18 +584,16 @@ def add_webdav_source(scfg) -> List[MediaItem]:
         return []
     # We’ll list recursively by walking known paths (simple & reliable).
     items = []
-    client = WebDAVClient({"webdav_hostname": scfg["url"],
-                           "webdav_login": scfg["username"],
-                           "webdav_password": scfg["password"]})
+    client = WEBDAV_CLIENT if scfg is WEBDAV_CFG else make_webdav_client(scfg)
     base = "/"
     stack = [base]
-    include_globs = scfg.get("include_globs", ["**/*.jpg","**/*.jpeg","**/*.png"])
+    include_pat = compile_globs(tuple(scfg.get("include_globs", ["**/*.jpg","**/*.jpeg","**/*.png"])))
     # NOTE: Some servers don’t expose recursive listings well; adjust for your tree.
     for root, dirs, files in client.list_iter(base, get_info=True):
         for f in files:
             remote = f["path"]
             name = os.path.basename(remote)
-            if not matches_any(remote, include_globs):
+            if not matches_any(remote, include_pat):
                 continue
             items.append(MediaItem(
                 id=hash_id("webdav", remote),
@@ -234,16 +610,14 @@ def add_s3_source(scfg) -> List[MediaItem]:
         log.error("S3 requested but boto3 missing")
         return []
     items = []
-    s3 = boto3.client("s3",
-                      endpoint_url=cfgval(scfg,"endpoint_url"),
-                      aws_access_key_id=cfgval(scfg,"access_key"),
-                      aws_secret_access_key=cfgval(scfg,"secret_key"))
+    s3 = S3_CLIENT if scfg is S3_CFG else make_s3_client(scfg)
     paginator = s3.get_paginator('list_objects_v2')
     prefix = scfg.get("prefix","")
+    include_pat = compile_globs(tuple(scfg.get("include_globs", ["**/*.jpg","**/*.jpeg","**/*.png"])))
     for page in paginator.paginate(Bucket=scfg["bucket"], Prefix=prefix):
         for obj in page.get("Contents", []):
             key = obj["Key"]
-            if not matches_any(key, scfg.get("include_globs", ["**/*.jpg","**/*.jpeg","**/*.png"])):
+            if not matches_any(key, include_pat):
                 continue
             items.append(MediaItem(
                 id=hash_id("s3", key),
@@ -259,33 +633,58 @@ def cfgval(d,k,default=None):
     v=d.get(k,os.environ.get(k.upper(),default))
     return v
 
+def make_s3_client(scfg):
+    return boto3.client("s3",
+                        endpoint_url=cfgval(scfg,"endpoint_url"),
+                        aws_access_key_id=cfgval(scfg,"access_key"),
+                        aws_secret_access_key=cfgval(scfg,"secret_key"),
+                        config=BotoConfig(max_pool_connections=32))
+
+def make_webdav_client(scfg):
+    return WebDAVClient({"webdav_hostname": scfg["url"],
+                         "webdav_login": scfg["username"],
+                         "webdav_password": scfg["password"]})
+
+# One client per remote type, shared by listing and downloads (boto3 clients
+# are thread-safe and keep their connection pool). Downloads use the first
+# source of each type.
+S3_CFG = next((s for s in CFG.get("sources", []) if s["type"] == "s3"), None)
+WEBDAV_CFG = next((s for s in CFG.get("sources", []) if s["type"] == "webdav"), None)
+S3_CLIENT = make_s3_client(S3_CFG) if (boto3 and S3_CFG) else None
+WEBDAV_CLIENT = make_webdav_client(WEBDAV_CFG) if (WebDAVClient and WEBDAV_CFG) else None
+
 def build_playlist():
-    global PLAYLIST, PLAYHEAD
+    global PLAYLIST, SHARED_HEAD
     items: List[MediaItem] = []
     min_w, min_h = CFG["playlist"].get("min_resolution", [0,0])
     sources = CFG.get("sources",[])
-    for s in sources:
-        t = s["type"]
-        if t == "local":
-            items += add_local_source(s)
-        elif t == "webdav":
-            items += add_webdav_source(s)
-        elif t == "s3":
-            items += add_s3_source(s)
+    adders = {"local": add_local_source, "webdav": add_webdav_source, "s3": add_s3_source}
+    jobs = [(adders[s["type"]], s) for s in sources if s["type"] in adders]
+    if jobs:
+        # Sources are independent (disk vs network), so list them concurrently
+        with ThreadPoolExecutor(max_workers=len(jobs)) as ex:
+            futures = [ex.submit(fn, s) for fn, s in jobs]
+            for fut in futures:  # config order, so sort ties stay stable across reindexes
+                items += fut.result()
     max_age_days = CFG["playlist"].get("max_age_days", 36500)
     cutoff = time.time() - max_age_days*86400
-    items = [i for i in items if i.mtime >= cutoff]
+    pl = Playlist.from_items(items)
+    keep = np.flatnonzero(pl.mtimes >= cutoff)
 
     # Optionally sort
     if CFG["playlist"].get("shuffle", True):
-        import random
-        random.shuffle(items)
+        order = np.random.permutation(keep)
     else:
         sort_key = CFG["playlist"].get("sort","mtime")
-        items.sort(key=lambda i: (i.mtime if sort_key=="mtime" else i.filename))
-
-    PLAYLIST = items
-    PLAYHEAD = 0
+        col = pl.mtimes if sort_key=="mtime" else np.array(pl.filenames)
+        order = keep[np.argsort(col[keep], kind="stable")]
+    pl = pl.take(order)
+
+    with PLAYLIST_LOCK:
+        PLAYLIST = pl
+        with SHARED_HEAD_LOCK:
+            SHARED_HEAD = itertools.count()
+        PLAYHEADS.clear()
     log.info("Playlist ready: %d items", len(PLAYLIST))
 
 # -------- HTTP server ----------
@@ -298,27 +697,59 @@ def api_reindex():
 def api_status():
     return jsonify({
         "count": len(PLAYLIST),
-        "playhead": PLAYHEAD,
+        "playheads": dict(PLAYHEADS),
         "devices": CFG["cast"]["devices"],
         "slide_seconds": CFG["cast"]["slide_seconds"]
     })
 
 @app.route("/image/<img_id>.jpg")
 def get_image(img_id):
-    # find item
-    matches = [m for m in PLAYLIST if m.id == img_id]
-    if not matches:
+    with PLAYLIST_LOCK:
+        item = PLAYLIST.find(img_id)
+    if item is None:
         abort(404)
-    item = matches[0]
     try:
-        out_path = render_cached(item)
+        data, etag, mtime = rendered_bytes(item)
     except Exception:
         abort(500)
-    return send_file(out_path, mimetype="image/jpeg", max_age=3600)
+    return send_file(data, mimetype="image/jpeg", max_age=3600,
+                     etag=etag, last_modified=mtime)
+
+# Render the next few slides while the current one is on screen, so the
+# Chromecast's fetch finds them already in CACHE_DIR.
+PRELOAD_NEXT = CFG.get("cast", {}).get("preload_next", True)
+PRELOAD_COUNT = 3
+PREFETCH_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch")
+PREFETCH_INFLIGHT: set = set()  # item ids queued/rendering, shared by all casters
+PREFETCH_LOCK = threading.Lock()
+
+def prefetch(item: MediaItem):
+    try:
+        render_cached(item)
+    except Exception:
+        log.debug("Prefetch failed for %s", item.path)
+    finally:
+        with PREFETCH_LOCK:
+            PREFETCH_INFLIGHT.discard(item.id)
+
+def schedule_prefetch(playlist: Playlist, head: int):
+    for i in range(1, PRELOAD_COUNT + 1):
+        item = playlist[(head + i) % len(playlist)]
+        with PREFETCH_LOCK:
+            if item.id in PREFETCH_INFLIGHT:
+                continue
+            PREFETCH_INFLIGHT.add(item.id)
+        PREFETCH_POOL.submit(prefetch, item)
+
+def first_head() -> int:
+    return next_shared_head() if SHARED_PLAYHEAD else 0
+
+def next_shared_head() -> int:
+    with SHARED_HEAD_LOCK:
+        return next(SHARED_HEAD)
 
 def cast_loop(dev_name: str, stop_evt: threading.Event):
     slide_seconds = CFG["cast"]["slide_seconds"]
-    global PLAYHEAD
     chromecasts, _ = pychromecast.get_listed_chromecasts(friendly_names=[dev_name])
     if not chromecasts:
         log.error("Chromecast not found: %s", dev_name)
@@ -327,22 +758,38 @@ def cast_loop(dev_name: str, stop_evt: threading.Event):
     cast.wait()
     mc = cast.media_controller
 
-    while not stop_evt.is_set() and PLAYLIST:
-        item = PLAYLIST[PLAYHEAD % len(PLAYLIST)]
-        url = f"{BASE_URL}/image/{item.id}.jpg"
-        log.debug("Casting to %s: %s", dev_name, url)
-        mc.play_media(url, "image/jpeg")
-        mc.block_until_active(timeout=10)
-        # Default Media Receiver shows the image and stays on it.
-        # We sleep the slide interval then move on.
-        for _ in range(int(slide_seconds*10)):
-            if stop_evt.is_set():
+    playlist = PLAYLIST
+    local_head = first_head()
+    PLAYHEADS[dev_name] = local_head
+    try:
+        while not stop_evt.is_set():
+            pl = PLAYLIST  # read once per slide; a reindex can swap it at any time
+            if not pl:
                 break
-            time.sleep(0.1)
-        PLAYHEAD += 1
-
-    mc.stop()
-    cast.quit_app()
+            if pl is not playlist:
+                # reindexed underneath us: start over on the new playlist
+                playlist = pl
+                local_head = first_head()
+                PLAYHEADS[dev_name] = local_head
+            item = playlist[local_head % len(playlist)]
+            url = f"{BASE_URL}/image/{item.id}.jpg"
+            log.debug("Casting to %s: %s", dev_name, url)
+            mc.play_media(url, "image/jpeg")
+            mc.block_until_active(timeout=10)
+            if PRELOAD_NEXT:
+                schedule_prefetch(playlist, local_head)
+            # Default Media Receiver shows the image and stays on it.
+            # We wait out the slide interval (or a stop) then move on.
+            if stop_evt.wait(timeout=slide_seconds):
+                break
+            local_head = next_shared_head() if SHARED_PLAYHEAD else local_head + 1
+            PLAYHEADS[dev_name] = local_head
+    finally:
+        # a restart may already have registered a new loop for this device
+        if CAST_STOP_FLAGS.get(dev_name) in (stop_evt, None):
+            PLAYHEADS.pop(dev_name, None)
+        mc.stop()
+        cast.quit_app()
     log.info("Casting stopped for %s", dev_name)
 
 @app.route("/api/start", methods=["POST"])
@@ -2,11 +2,31 @@
 set -euo pipefail
 
 cd /opt/photocastd
+sudo apt-get install -y libturbojpeg0
 python3 -m venv .venv
 source .venv/bin/activate
 pip install --upgrade pip
 pip install -r requirements.txt
 
+# On x86_64 CPUs with AVX2, swap stock Pillow for Pillow-SIMD (same API,
+# AVX2 resize kernels). It only ships as source, so install a toolchain first.
+# ARM (the Raspberry Pi) and pre-AVX2 x86 keep the pinned Pillow: an -mavx2
+# build would die with SIGILL there.
+# pillow-heif pins "pillow" as a dependency, so do this after requirements.
+# Both packages own PIL/, and requirements just reinstalled stock Pillow over
+# any earlier swap, so always force-reinstall the wheel (re-runs stay safe).
+# A failed build keeps stock Pillow rather than aborting the install.
+if [ "$(uname -m)" = "x86_64" ] && grep -qw avx2 /proc/cpuinfo; then
+  sudo apt-get install -y build-essential python3-dev libjpeg-dev zlib1g-dev
+  rm -rf /tmp/pillow-simd
+  if CC="cc -mavx2" pip wheel --no-cache-dir --no-deps -w /tmp/pillow-simd pillow-simd==10.4.0.post0; then
+    pip uninstall -y pillow
+    pip install --no-deps --force-reinstall /tmp/pillow-simd/pillow_simd-*.whl
+  else
+    echo "pillow-simd build failed; keeping stock Pillow" >&2
+  fi
+fi
+
 # Create systemd unit
 sudo tee /etc/systemd/system/photocastd.service >/dev/null <<'UNIT'
 [Unit]